@@ -33,8 +33,6 @@ def fetch_topics(session: requests.Session, base_url: str, category_id: int, sta
     """Fetch topics from a category within the specified date range."""
     topics = []
     page = 0
-    start_timestamp = int(start_date.timestamp())
-    end_timestamp = int(end_date.timestamp())
     
     while True:
         url = f"{base_url}/c/{category_id}.json?page={page}"
@@ -50,9 +48,9 @@ def fetch_topics(session: requests.Session, base_url: str, category_id: int, sta
             break
         
         for topic in topic_list:
-            created_at = datetime.datetime.strptime(topic['created_at'], '%Y-%m-%dT%H:%M:%S.%fZ')
-            created_timestamp = int(created_at.timestamp())
-            if start_timestamp <= created_timestamp <= end_timestamp:
+            # fromisoformat is C-implemented; dropping the trailing 'Z' keeps it naive like start/end
+            created_at = datetime.datetime.fromisoformat(topic['created_at'].removesuffix('Z'))
+            if start_date <= created_at <= end_date:
                 topics.append(topic)
         
         page += 1
@@ -79,8 +77,9 @@ def fetch_topic_posts(session: requests.Session, base_url: str, topic_id: int) -
 def save_data(data: List[Dict[str, Any]], output_file: str) -> None:
     """Save scraped data to a JSON file."""
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    # Encode in one go and issue a single write instead of one write per JSON token
     with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.write(json.dumps(data, ensure_ascii=False, indent=2))
 
 def main():
     # Constants
@@ -127,16 +126,15 @@ def main():
         print(f"Fetching posts for topic {topic_id}: {topic_title}")
         posts = fetch_topic_posts(session, DISCOURSE_URL, topic_id)
         
-        for post in posts:
-            all_posts.append({
-                'topic_id': topic_id,
-                'topic_title': topic_title,
-                'post_id': post['id'],
-                'post_content': post.get('cooked', ''),
-                'created_at': post.get('created_at', ''),
-                'username': post.get('username', ''),
-                'post_number': post.get('post_number', 1)
-            })
+        all_posts.extend({
+            'topic_id': topic_id,
+            'topic_title': topic_title,
+            'post_id': post['id'],
+            'post_content': post.get('cooked', ''),
+            'created_at': post.get('created_at', ''),
+            'username': post.get('username', ''),
+            'post_number': post.get('post_number', 1)
+        } for post in posts)
         time.sleep(1)  # Respectful delay
     
     # Save data
@@ -1,6 +1,6 @@
 import json
-import datetime
 import os
+import functools
 from typing import List, Dict, Any
 import html2text
 try:
@@ -15,6 +15,11 @@ def clean_content(html_content: str) -> str:
     h.ignore_images = True
     return h.handle(html_content).strip()
 
+@functools.lru_cache(maxsize=1)
+def get_encoding():
+    """Load the gpt-4o tokenizer once instead of once per topic."""
+    return tiktoken.encoding_for_model('gpt-4o')
+
 def chunk_content(content: str, topic_id: int, max_tokens: int = 4096) -> List[Dict[str, Any]]:
     """Chunk content into pieces under max_tokens, returning a list of partial documents."""
     if tiktoken is None:
@@ -22,7 +27,7 @@ def chunk_content(content: str, topic_id: int, max_tokens: int = 4096) -> List[D
         posts = content.split(' | ')
         return [{"content": post.strip(), "chunk_id": f"{topic_id}_{i+1}"} for i, post in enumerate(posts) if post.strip()]
     
-    encoding = tiktoken.encoding_for_model('gpt-4o')
+    encoding = get_encoding()
     tokens = encoding.encode(content)
     
     if len(tokens) <= max_tokens:
@@ -85,9 +90,8 @@ def process_json(input_file: str, output_file: str, max_tokens: int = 4096) -> N
             content_parts.append(f"Post {post['post_number']}: {cleaned_content}")
         content = " | ".join(content_parts)
         
-        # Simplify timestamp
-        created_at = datetime.datetime.strptime(topic_data['timestamp'], '%Y-%m-%dT%H:%M:%S.%fZ')
-        timestamp = created_at.strftime('%Y-%m-%d')
+        # Simplify timestamp: created_at is ISO 8601, so the date is its first 10 characters
+        timestamp = topic_data['timestamp'][:10]
         
         # Construct URL
         url = f"https://discourse.onlinedegree.iitm.ac.in/t/{topic_id}"
@@ -96,19 +100,19 @@ def process_json(input_file: str, output_file: str, max_tokens: int = 4096) -> N
         chunks = chunk_content(content, topic_id, max_tokens)
         
         # Create documents for each chunk
-        for chunk in chunks:
-            output_data.append({
-                'topic_id': f"{chunk['chunk_id']}",
-                'topic_title': topic_data['topic_title'],
-                'content': chunk['content'],
-                'url': url,
-                'timestamp': timestamp
-            })
+        topic_title = topic_data['topic_title']
+        output_data.extend({
+            'topic_id': f"{chunk['chunk_id']}",
+            'topic_title': topic_title,
+            'content': chunk['content'],
+            'url': url,
+            'timestamp': timestamp
+        } for chunk in chunks)
     
     # Save output
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
     with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(output_data, f, ensure_ascii=False, indent=2)
+        f.write(json.dumps(output_data, ensure_ascii=False, indent=2))
     print(f"Saved {len(output_data)} documents to {output_file}")
 
 if __name__ == "__main__":
@@ -65,7 +65,7 @@ def generate_embedding(text: str) -> List[float]:
 #Index posts with embeddings in Typesense.
 
 def index_posts(posts: List[Dict]) -> None:
-    jsonl_data = []
+    documents = []
     for post in posts:
         embedding = generate_embedding(post["content"])
         print(f"Generated embedding for post {post['topic_id']}.")
@@ -80,12 +80,13 @@ def index_posts(posts: List[Dict]) -> None:
             "timestamp": post["timestamp"],
             "embedding": embedding
         }
-        jsonl_data.append(json.dumps(document))
+        documents.append(document)
     
-    if jsonl_data:
+    if documents:
         try:
-            response = typesense_client.collections[COLLECTION_NAME].documents.import_(jsonl_data, {'action': 'upsert'})
-            print(f"Indexed {len(jsonl_data)} posts in {COLLECTION_NAME}.")
+            # The client serialises the dicts to JSONL itself; pre-encoded strings would be encoded twice
+            response = typesense_client.collections[COLLECTION_NAME].documents.import_(documents, {'action': 'upsert'})
+            print(f"Indexed {len(documents)} posts in {COLLECTION_NAME}.")
             for res in response:
                 if not res["success"]:
                     print(f"Error indexing post {res['document']['topic_id']}: {res['error']}")
@@ -107,6 +108,9 @@ modules = [
     "project-1", "project-2", "misc"
 ]
 
+# Documents sent per Typesense import request
+IMPORT_BATCH_SIZE = 250
+
 # Schema template
 chapters_schema = {
     "fields": [
@@ -135,7 +139,8 @@ for directory in modules:
     with open(chunks_file, 'r') as f:
         chunks = json.load(f)
 
-    # Generate embeddings and index
+    # Generate embeddings
+    documents = []
     for chunk in chunks:
         # Generate embedding
         response = openai_client.embeddings.create(
@@ -146,18 +151,27 @@ for directory in modules:
 
 
         # Prepare document for Typesense
-        document = {
+        documents.append({
             "id": chunk["id"],
             "content": chunk["content"],
             "embedding": embedding
-        }
+        })
 
-        # Index in Typesense
+    # Index in Typesense with a single bulk import per batch
+    collection_documents = typesense_client.collections[collection_name].documents
+    for i in range(0, len(documents), IMPORT_BATCH_SIZE):
+        batch = documents[i:i + IMPORT_BATCH_SIZE]
         try:
-            typesense_client.collections[collection_name].documents.create(document)
-            print(f"Indexed {chunk['id']} in {collection_name}")
+            response = collection_documents.import_(
+                batch, {'action': 'create', 'batch_size': IMPORT_BATCH_SIZE}
+            )
+            for doc, res in zip(batch, response):
+                if res["success"]:
+                    print(f"Indexed {doc['id']} in {collection_name}")
+                else:
+                    print(f"Error indexing {doc['id']}: {res['error']}")
         except Exception as e:
-            print(f"Error indexing {chunk['id']}: {e}")
+            print(f"Batch indexing error in {collection_name}: {e}")
 
 
 
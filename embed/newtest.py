@@ -1,13 +1,16 @@
 import os
+import sys
 import json
+import asyncio
 import copy
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Set
 from dotenv import load_dotenv
 import typesense
 from typesense.exceptions import ObjectNotFound
 from openai import OpenAI
 from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 
 # Load environment variables
 load_dotenv()
@@ -36,6 +39,9 @@ MODULES = [
     "project-1", "project-2", "misc"
 ]
 
+# Posts/chunks embedded and upserted per round; bounds memory held for embeddings
+INDEX_BATCH_SIZE = 1000
+
 # Schemas
 DISCOURSE_SCHEMA = {
     "name": DISCOURSE_COLLECTION,
@@ -80,33 +86,44 @@ def generate_embedding(text: str) -> List[float]:
         print(f"Error generating embedding: {e}")
         return []
 
+def existing_document_ids(collection_name: str) -> Set[str]:
+    try:
+        export_output = typesense_client.collections[collection_name].documents.export({"include_fields": "id"})
+    except Exception as e:
+        print(f"Could not list existing documents in {collection_name}: {e}")
+        return set()
+    return {json.loads(line)["id"] for line in export_output.splitlines() if line}
+
 def index_discourse_posts(posts: List[Dict]) -> None:
-    texts = [post["content"] for post in posts]
-    embeddings = batch_generate_embeddings(texts)
-
-    jsonl_data = []
-    for post, embedding in zip(posts, embeddings):
-        if not embedding:
-            print(f"Skipping post {post['topic_id']} due to embedding error.")
-            continue
-        document = {
-            "topic_id": post["topic_id"],
-            "topic_title": post["topic_title"],
-            "content": post["content"],
-            "url": post["url"],
-            "timestamp": post["timestamp"],
-            "embedding": embedding
-        }
-        jsonl_data.append(json.dumps(document))
-    
-    if jsonl_data:
-        if jsonl_data:
-            documents = [json.loads(doc) for doc in jsonl_data]
-            batch_upsert_documents(COLLECTION_NAME, documents)
-            print(f"Indexed {len(documents)} posts in {COLLECTION_NAME}.")
-
-
-def index_module_chunks(module: str) -> None:
+    indexed = 0
+    # Embed and upsert one slice at a time so only INDEX_BATCH_SIZE embeddings are held in memory
+    for i in range(0, len(posts), INDEX_BATCH_SIZE):
+        batch = posts[i:i + INDEX_BATCH_SIZE]
+        embeddings = batch_generate_embeddings([post["content"] for post in batch])
+
+        documents = []
+        for post, embedding in zip(batch, embeddings):
+            if not embedding:
+                print(f"Skipping post {post['topic_id']} due to embedding error.")
+                continue
+            document = {
+                "topic_id": post["topic_id"],
+                "topic_title": post["topic_title"],
+                "content": post["content"],
+                "url": post["url"],
+                "timestamp": post["timestamp"],
+                "embedding": embedding
+            }
+            documents.append(document)
+
+        if documents:
+            batch_upsert_documents(DISCOURSE_COLLECTION, documents)
+            indexed += len(documents)
+
+    print(f"Indexed {indexed} posts in {DISCOURSE_COLLECTION}.")
+
+
+def index_module_chunks(module: str, skip_existing: bool = False) -> None:
     collection_name = module
     create_collection(collection_name, CHAPTERS_SCHEMA)
 
@@ -118,27 +135,40 @@ def index_module_chunks(module: str) -> None:
     with open(chunks_file, 'r') as f:
         chunks = json.load(f)
 
-    texts = [chunk["content"] for chunk in chunks]
-    embeddings = batch_generate_embeddings(texts)
+    # Chunks are upserted so edited content is refreshed; skipping ids that are already
+    # indexed is only safe when chunks.json has not been regenerated since the last run
+    if skip_existing:
+        existing_ids = existing_document_ids(collection_name)
+        if existing_ids:
+            total = len(chunks)
+            chunks = [chunk for chunk in chunks if chunk["id"] not in existing_ids]
+            print(f"Skipping {total - len(chunks)} already indexed chunks in {collection_name}")
+
+    indexed = 0
+    for i in range(0, len(chunks), INDEX_BATCH_SIZE):
+        batch = chunks[i:i + INDEX_BATCH_SIZE]
+        embeddings = batch_generate_embeddings([chunk["content"] for chunk in batch])
+
+        batched_documents = []
 
-    batched_documents = []
+        for chunk, embedding in zip(batch, embeddings):
+            if not embedding:
+                print(f"Skipping chunk {chunk['id']} due to embedding error.")
+                continue
 
-    for chunk, embedding in zip(chunks, embeddings):
-        if not embedding:
-            print(f"Skipping chunk {chunk['id']} due to embedding error.")
-            continue
+            document = {
+                "id": chunk["id"],
+                "content": chunk["content"],
+                "embedding": embedding
+            }
 
-        document = {
-            "id": chunk["id"],
-            "content": chunk["content"],
-            "embedding": embedding
-        }
+            batched_documents.append(document)
 
-        batched_documents.append(document)
+        # Batch upsert to Typesense
+        batch_upsert_documents(collection_name, batched_documents)
+        indexed += len(batched_documents)
 
-    # Batch upsert to Typesense
-    batch_upsert_documents(collection_name, batched_documents)
-    print(f"Indexed {len(batched_documents)} chunks in {collection_name}")
+    print(f"Indexed {indexed} chunks in {collection_name}")
 
 
 
@@ -159,17 +189,20 @@ def process_discourse_posts() -> None:
     except Exception as e:
         print(f"Error reading {JSON_FILE}: {e}")
 
-def process_module_chunks() -> None:
-    for module in MODULES:
-        index_module_chunks(module)
+def process_module_chunks(max_workers: int = 4, skip_existing: bool = False) -> None:
+    # Modules are independent collections, so index several at once
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(MODULES))) as executor:
+        list(executor.map(lambda module: index_module_chunks(module, skip_existing), MODULES))
 
 
 # --- New: Batched Embedding Function ---
 
 def batch_generate_embeddings(texts: List[str], batch_size: int = 1) -> List[List[float]]:
+    # Repeated texts (e.g. boilerplate posts or chunks) are embedded once and shared
+    unique_texts = list(dict.fromkeys(texts))
     embeddings = []
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i+batch_size]
+    for i in range(0, len(unique_texts), batch_size):
+        batch = unique_texts[i:i+batch_size]
         try:
             response = openai_client.embeddings.create(
                 model="text-embedding-3-small",
@@ -180,27 +213,40 @@ def batch_generate_embeddings(texts: List[str], batch_size: int = 1) -> List[Lis
         except Exception as e:
             print(f"Error generating batch embeddings: {e}")
             embeddings.extend([[] for _ in batch])  # Empty embeddings for failed ones
-    return embeddings
+    embedding_by_text = dict(zip(unique_texts, embeddings))
+    return [embedding_by_text[text] for text in texts]
 
 #    ------- Batch Upsert Function -------
-def batch_upsert_documents(collection_name: str, documents: List[Dict], batch_size: int = 1) -> None:
-    for i in range(0, len(documents), batch_size):
-        batch = documents[i:i + batch_size]
-        jsonl_batch = [json.dumps(doc) for doc in batch]
-        try:
-            response = typesense_client.collections[collection_name].documents.import_(
-                jsonl_batch, {'action': 'upsert'}
-            )
-            for res in response:
-                if not res["success"]:
-                    print(f"Error indexing document {res['document'].get('id', 'unknown')}: {res['error']}")
-        except Exception as e:
-            print(f"Batch indexing error in {collection_name}: {e}")
-
-
-def main():
+async def _upsert_batches(collection_name: str, batches: List[List[Dict]], concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+    collection_documents = typesense_client.collections[collection_name].documents
+
+    async def upsert_batch(batch: List[Dict]) -> None:
+        async with semaphore:
+            try:
+                response = await asyncio.to_thread(
+                    collection_documents.import_,
+                    batch, {'action': 'upsert', 'batch_size': len(batch)}
+                )
+                for doc, res in zip(batch, response):
+                    if not res["success"]:
+                        # Discourse posts have no id field; label them by topic instead
+                        label = doc.get('id') or f"topic {doc.get('topic_id', 'unknown')}"
+                        print(f"Error indexing document {label}: {res['error']}")
+            except Exception as e:
+                print(f"Batch indexing error in {collection_name}: {e}")
+
+    await asyncio.gather(*(upsert_batch(batch) for batch in batches))
+
+def batch_upsert_documents(collection_name: str, documents: List[Dict], batch_size: int = 250, concurrency: int = 4) -> None:
+    batches = [documents[i:i + batch_size] for i in range(0, len(documents), batch_size)]
+    asyncio.run(_upsert_batches(collection_name, batches, concurrency))
+
+
+def main(skip_existing: bool = False):
     process_discourse_posts()
-    process_module_chunks()
+    process_module_chunks(skip_existing=skip_existing)
 
 if __name__ == "__main__":
-    main()
+    # Pass --skip-existing to only embed chunks whose ids are not indexed yet
+    main(skip_existing="--skip-existing" in sys.argv[1:])
@@ -1,7 +1,22 @@
-from fastapi import FastAPI
+import os
+import json
+import asyncio
+import operator
+import functools
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+import anyio
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
 import typesense
-import openai
+from typesense.exceptions import TypesenseClientError
+from openai import AsyncOpenAI
 from pydantic import BaseModel
+from dotenv import load_dotenv
+
+load_dotenv()
 
 app = FastAPI()
 
@@ -9,95 +24,333 @@ app = FastAPI()
 client = typesense.Client({
     'nodes': [{'host': 'localhost', 'port': '8108', 'protocol': 'http'}],
     'api_key': 'your-api-key',
-    'connection_timeout_seconds': 2
+    # One multi_search request carries up to 20 vector searches, so allow more than one search's worth
+    'connection_timeout_seconds': 10
 })
 
-# OpenAI client
-openai.api_key = 'your-openai-api-key'
+# Dedicated, explicitly sized pool for blocking Typesense calls; bursts of searches queue here
+search_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="typesense")
+
+# OpenAI client (async so embedding/chat calls don't block the event loop).
+# The SDK retries 429/5xx responses with exponential backoff. Built on first use so the app
+# imports without OPENAI_API_KEY; OPENAI_BASE_URL points it at a proxy, else OpenAI itself.
+@functools.lru_cache(maxsize=1)
+def get_openai_client() -> AsyncOpenAI:
+    return AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=os.getenv("OPENAI_BASE_URL"),
+        max_retries=4
+    )
+
+# Cap concurrent OpenAI calls so request bursts queue here instead of tripping rate limits.
+# Embeddings get their own limit: a streamed chat completion holds its slot until the client
+# has read every frame, and slow readers must not hold up embedding (or cache-served) requests.
+MAX_CONCURRENT_EMBEDDING_CALLS = 16
+MAX_CONCURRENT_CHAT_CALLS = 8
+embedding_semaphore = asyncio.Semaphore(MAX_CONCURRENT_EMBEDDING_CALLS)
+chat_semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHAT_CALLS)
+
+# Typesense collections, one per course chapter
+CHAPTERS = (
+    "development_tools", "deployment_tools", "large_language_models",
+    "data_sourcing", "data_preparation", "data_analysis", "data_visualization",
+    "project-1", "project-2", "misc"
+)
 
 class Query(BaseModel):
     prompt: str
 
-async def identify_chapter(prompt_embedding):
-    chapters = [
-        "development_tools", "deployment_tools", "large_language_models",
-        "data_sourcing", "data_preparation", "data_analysis", "data_visualization",
-        "project-1", "project-2", "misc"
-    ]
+# Cached chapters and answers depend on the search index, which the embed scripts rebuild
+# out of process; expire them so a reindex is picked up within this many seconds
+INDEX_CACHE_TTL_SECONDS = 3600
+
+# Embeddings and chapters for recently seen prompts (LRU, most recent last)
+PROMPT_CACHE_SIZE = 512
+embedding_cache: OrderedDict[str, List[float]] = OrderedDict()
+chapter_cache: OrderedDict[str, Tuple[float, Optional[str]]] = OrderedDict()
+
+# Answers to recent questions, matched by embedding similarity (LRU, most recent last)
+ANSWER_CACHE_SIZE = 256
+ANSWER_CACHE_MIN_SIMILARITY = 0.95
+answer_cache: OrderedDict[str, Tuple[float, List[float], dict]] = OrderedDict()
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+CHAT_MODEL = "gpt-4o-mini"
+SYSTEM_MESSAGE = {"role": "system", "content": "Answer the question based on the provided context."}
+NO_ANSWER = "I couldn’t find specific information to answer your question."
+
+# Server-sent event frames that never change, encoded once
+DONE_FRAME = f"data: {json.dumps({'done': True})}\n\n"
+# Same source/delta/done sequence as a real answer, so clients need no special case
+NO_ANSWER_FRAMES = (
+    f"data: {json.dumps({'source': None})}\n\n"
+    f"data: {json.dumps({'delta': NO_ANSWER})}\n\n"
+    + DONE_FRAME
+)
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.lower().split())
+
+async def multi_search(searches: List[dict]) -> List[dict]:
+    """Run several searches in a single Typesense round-trip, returning one result per search."""
+    # The typesense client is synchronous; run it in a worker thread so the event loop stays free
+    loop = asyncio.get_running_loop()
+    response = await loop.run_in_executor(
+        search_executor, client.multi_search.perform, {"searches": searches}, {}
+    )
+    results = response["results"]
+    # multi_search answers 200 even when individual searches fail; each failure is an
+    # {"code", "error"} entry in place of its result
+    failed = [(search, result) for search, result in zip(searches, results) if "error" in result]
+    for search, result in failed:
+        print(f"Search in {search['collection']} failed ({result.get('code')}): {result['error']}")
+    # A missing collection is skipped; anything else (bad key, wrong vector size) is a real error
+    if failed and (len(failed) == len(results) or any(result.get("code") != 404 for _, result in failed)):
+        raise TypesenseClientError(f"{len(failed)} of {len(results)} searches failed: {failed[0][1]['error']}")
+    return results
+
+async def identify_chapter(prompt_vector: str):
     max_similarity = 0
     best_chapter = None
-    for chapter in chapters:
-        results = client.collections[chapter].search({
+    # Probe every chapter in one multi_search request; the searches are independent
+    chapter_results = await multi_search([
+        {
+            "collection": chapter,
             "q": "*",
-            "vector_query": f"embedding:({prompt_embedding}, k:1)"
-        })
-        if results["hits"] and results["hits"][0]["vector_distance"] < 0.3:  # Lower distance = higher similarity
+            "vector_query": f"embedding:({prompt_vector}, k:1)"
+        }
+        for chapter in CHAPTERS
+    ])
+    for chapter, results in zip(CHAPTERS, chapter_results):
+        if results.get("hits") and results["hits"][0]["vector_distance"] < 0.3:  # Lower distance = higher similarity
             similarity = 1 - results["hits"][0]["vector_distance"]
             if similarity > max_similarity:
                 max_similarity = similarity
                 best_chapter = chapter
     return best_chapter if max_similarity > 0.7 else None
 
-@app.post("/answer")
-async def answer_question(query: Query):
+def format_vector(embedding: List[float]) -> str:
+    return "[" + ",".join(map(str, embedding)) + "]"
+
+def is_expired(stored_at: float) -> bool:
+    return time.monotonic() - stored_at > INDEX_CACHE_TTL_SECONDS
+
+def exact_cached_answer(prompt: str) -> Optional[dict]:
+    cache_key = normalize_prompt(prompt)
+    if cache_key not in answer_cache:
+        return None
+    stored_at, _, answer = answer_cache[cache_key]
+    if is_expired(stored_at):
+        del answer_cache[cache_key]
+        return None
+    answer_cache.move_to_end(cache_key)
+    return answer
+
+def most_similar_key(embedding: List[float], entries: List[Tuple[str, List[float]]]) -> Optional[str]:
+    best_key = None
+    best_similarity = ANSWER_CACHE_MIN_SIMILARITY
+    for key, cached_embedding in entries:
+        # OpenAI embeddings are unit length, so the dot product is the cosine similarity
+        similarity = sum(map(operator.mul, embedding, cached_embedding))
+        if similarity >= best_similarity:
+            best_key = key
+            best_similarity = similarity
+    return best_key
+
+async def lookup_cached_answer(embedding: List[float]) -> Optional[dict]:
+    # Drop stale answers first so the scan never matches an answer from before a reindex
+    for key in [key for key, (stored_at, _, _) in answer_cache.items() if is_expired(stored_at)]:
+        del answer_cache[key]
+    # Snapshot the cache so the scan can run in a worker thread while requests keep updating it
+    entries = [(key, cached_embedding) for key, (_, cached_embedding, _) in answer_cache.items()]
+    if not entries:
+        return None
+    best_key = await asyncio.to_thread(most_similar_key, embedding, entries)
+    if best_key is None or best_key not in answer_cache:
+        return None
+    answer_cache.move_to_end(best_key)
+    return answer_cache[best_key][2]
+
+def cache_answer(prompt: str, embedding: List[float], answer: dict) -> None:
+    answer_cache[normalize_prompt(prompt)] = (time.monotonic(), embedding, answer)
+    if len(answer_cache) > ANSWER_CACHE_SIZE:
+        answer_cache.popitem(last=False)
+
+async def embed_prompt(prompt: str) -> List[float]:
+    """Embed a prompt, reusing the embedding for prompts we've already seen."""
+    cache_key = normalize_prompt(prompt)
+    if cache_key in embedding_cache:
+        embedding_cache.move_to_end(cache_key)
+        return embedding_cache[cache_key]
+
     # Generate embedding for prompt
-    response = openai.Embedding.create(
-        model="text-embedding-3-small",
-        input=query.prompt
-    )
-    prompt_embedding = response["data"][0]["embedding"]
+    async with embedding_semaphore:
+        response = await get_openai_client().embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=prompt
+        )
+    prompt_embedding = response.data[0].embedding
 
-    # Identify chapter
-    chapter = await identify_chapter(prompt_embedding)
+    embedding_cache[cache_key] = prompt_embedding
+    if len(embedding_cache) > PROMPT_CACHE_SIZE:
+        embedding_cache.popitem(last=False)
+    return prompt_embedding
 
-    results = []
-    if chapter:
+async def find_chapter(prompt: str, prompt_vector: str) -> Optional[str]:
+    """Pick the chapter for a prompt, reusing the choice for prompts we've already seen."""
+    cache_key = normalize_prompt(prompt)
+    if cache_key in chapter_cache:
+        stored_at, chapter = chapter_cache[cache_key]
+        if not is_expired(stored_at):
+            chapter_cache.move_to_end(cache_key)
+            return chapter
+
+    chapter = await identify_chapter(prompt_vector)
+
+    chapter_cache[cache_key] = (time.monotonic(), chapter)
+    chapter_cache.move_to_end(cache_key)
+    if len(chapter_cache) > PROMPT_CACHE_SIZE:
+        chapter_cache.popitem(last=False)
+    return chapter
+
+async def search_context(prompt: str, prompt_vector: str, chapter: Optional[str]) -> list:
+    """Collect the hits to answer a prompt from, searching every chapter if none was identified."""
+    # Search the identified chapter, or every chapter as a fallback
+    chapters = (chapter,) if chapter else CHAPTERS
+    searches = []
+    for chap in chapters:
         # Semantic search
-        semantic_results = client.collections[chapter].search({
+        searches.append({
+            "collection": chap,
             "q": "*",
-            "vector_query": f"embedding:({prompt_embedding}, k:5)"
+            "vector_query": f"embedding:({prompt_vector}, k:5)"
         })
-        results.extend(semantic_results["hits"])
-
         # Keyword search
-        keyword_results = client.collections[chapter].search({
-            "q": query.prompt,
+        searches.append({
+            "collection": chap,
+            "q": prompt,
             "query_by": "content",
             "per_page": 5
         })
-        results.extend(keyword_results["hits"])
-
-    # Fallback: Search all chapters if no results or no chapter identified
-    if not results and not chapter:
-        for chap in [
-            "development_tools", "deployment_tools", "large_language_models",
-            "data_sourcing", "data_preparation", "data_analysis", "data_visualization",
-            "project-1", "project-2", "misc"
-        ]:
-            semantic_results = client.collections[chap].search({
-                "q": "*",
-                "vector_query": f"embedding:({prompt_embedding}, k:5)"
-            })
-            results.extend(semantic_results["hits"])
-            keyword_results = client.collections[chap].search({
-                "q": query.prompt,
-                "query_by": "content",
-                "per_page": 5
-            })
-            results.extend(keyword_results["hits"])
+
+    results = []
+    for search_results in await multi_search(searches):
+        results.extend(search_results.get("hits", []))
+    return results
+
+def build_messages(prompt: str, results: list) -> list:
+    # Semantic and keyword searches often return the same chunk; include each document once
+    seen_ids = set()
+    contents = []
+    for hit in results:
+        document = hit["document"]
+        if document["id"] in seen_ids:
+            continue
+        seen_ids.add(document["id"])
+        if content := document.get("content", "").strip():
+            contents.append(content)
+    context = "\n".join(contents)
+    return [
+        SYSTEM_MESSAGE,
+        {"role": "user", "content": f"Context: {context}\n\nQuestion: {prompt}"}
+    ]
+
+@app.post("/answer")
+async def answer_question(query: Query):
+    # Nothing to embed or search for; skip the API calls entirely
+    if not query.prompt.strip():
+        return {"answer": NO_ANSWER, "source": None}
+
+    # Serve a stored answer for a repeated question before doing any work
+    if cached := exact_cached_answer(query.prompt):
+        return cached
+
+    prompt_embedding = await embed_prompt(query.prompt)
+
+    # Serve a stored answer when a near-identical question was answered recently
+    if cached := await lookup_cached_answer(prompt_embedding):
+        return cached
+
+    # Format the vector once; it is reused by every collection search
+    prompt_vector = format_vector(prompt_embedding)
+    chapter = await find_chapter(query.prompt, prompt_vector)
+    results = await search_context(query.prompt, prompt_vector, chapter)
 
     # Generate answer with GPT-4o-mini
     if results:
-        context = "\n".join([hit["document"]["content"] for hit in results])
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "Answer the question based on the provided context."},
-                {"role": "user", "content": f"Context: {context}\n\nQuestion: {query.prompt}"}
-            ]
-        )
-        answer = response["choices"][0]["message"]["content"]
+        async with chat_semaphore:
+            response = await get_openai_client().chat.completions.create(
+                model=CHAT_MODEL,
+                messages=build_messages(query.prompt, results)
+            )
+        answer = response.choices[0].message.content
         source = chapter if chapter else "multiple chapters"
-        return {"answer": answer, "source": source}
+        result = {"answer": answer, "source": source}
+        # Don't pin an empty (e.g. content-filtered) completion in the cache
+        if answer:
+            cache_answer(query.prompt, prompt_embedding, result)
+        return result
     else:
-        return {"answer": "I couldn’t find specific information to answer your question.", "source": None}
\ No newline at end of file
+        return {"answer": NO_ANSWER, "source": None}
+
+@app.post("/answer/stream")
+async def answer_question_stream(query: Query, request: Request):
+    """Same as /answer, but streams progress and the answer as server-sent events.
+
+    The chapter is sent as soon as retrieval finishes, then the answer text arrives
+    as 'delta' frames, and a final frame carries 'done': true.
+    """
+    async def event_stream():
+        if not query.prompt.strip():
+            yield NO_ANSWER_FRAMES
+            return
+
+        # Replay a stored answer for a repeated or near-identical question
+        cached = exact_cached_answer(query.prompt)
+        if cached is None:
+            prompt_embedding = await embed_prompt(query.prompt)
+            cached = await lookup_cached_answer(prompt_embedding)
+        if cached:
+            yield f"data: {json.dumps({'source': cached['source']})}\n\n"
+            yield f"data: {json.dumps({'delta': cached['answer']})}\n\n"
+            yield DONE_FRAME
+            return
+
+        prompt_vector = format_vector(prompt_embedding)
+        chapter = await find_chapter(query.prompt, prompt_vector)
+        results = await search_context(query.prompt, prompt_vector, chapter)
+        if not results:
+            yield NO_ANSWER_FRAMES
+            return
+        source = chapter if chapter else "multiple chapters"
+        yield f"data: {json.dumps({'source': source})}\n\n"
+        answer_parts = []
+        async with chat_semaphore:
+            stream = await get_openai_client().chat.completions.create(
+                model=CHAT_MODEL,
+                messages=build_messages(query.prompt, results),
+                stream=True
+            )
+            try:
+                async for chunk in stream:
+                    # Stop generating (and paying for) tokens once the client has gone away
+                    if await request.is_disconnected():
+                        return
+                    if chunk.choices and (delta := chunk.choices[0].delta.content):
+                        answer_parts.append(delta)
+                        yield f"data: {json.dumps({'delta': delta})}\n\n"
+            finally:
+                # Starlette usually cancels this generator on disconnect while it waits for the
+                # next chunk; shield the close so the upstream connection is still released
+                with anyio.CancelScope(shield=True):
+                    await stream.close()
+        if answer_parts:
+            cache_answer(query.prompt, prompt_embedding, {"answer": "".join(answer_parts), "source": source})
+        yield DONE_FRAME
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Ask nginx-style reverse proxies to pass frames through instead of buffering them
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )